@@ -1,8 +1,16 @@
 import os
+import numpy as np
 from torch.utils.data import Dataset
+from torchvision.io import read_image, ImageReadMode
+from torchvision.transforms import v2
 from PIL import Image, ImageFilter
+import gc
 import json
-import glob
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import product
 import warnings
 from math import inf
 import transformers
@@ -13,6 +21,238 @@ warnings.filterwarnings("ignore")
 sizes = [(45, 45), (90, 90), (135, 135), (180, 180), (224, 224)]
 percents = ['20', '40', '60', '80', '100']
 
+# Geirhos stimulus names are <shape instance>-<texture instance>.png, eg. airplane1-clock2.png
+stimulus_name_pattern = re.compile(r'^([A-Za-z]+\d+)-([A-Za-z]+\d+)\.png$')
+
+
+def load_json(path):
+    """Loads a JSON file (eg. shape classes, triplets, seeds). Every call parses the
+    file again, so callers own the returned objects and may modify them.
+
+    Files like geirhos_triplets.json decode into millions of small lists, and most of
+    the decoding time is spent in cyclic garbage collection passes over them. None of
+    these objects can be garbage yet, so collection is paused while parsing.
+
+    :param path: location of the JSON file.
+    :return: the parsed contents of the file."""
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        with open(path) as file:
+            return json.load(file)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def list_files(path, extension=''):
+    """Lists the names of the (non-hidden) files in a directory, optionally only those
+    with a given extension. os.scandir reports each entry's type along with its name,
+    so unlike glob.glob or os.listdir + os.path.isfile this needs no stat per entry.
+
+    :param path: the directory to list.
+    :param extension: only include files whose names end with this, eg. '.png'.
+    :return: a list of file names."""
+
+    with os.scandir(path) as entries:
+        return [entry.name for entry in entries if entry.name.endswith(extension)
+                and not entry.name.startswith('.') and entry.is_file()]
+
+
+def list_dirs(path):
+    """Lists the names of the (non-hidden) subdirectories of a directory in a single
+    os.scandir pass.
+
+    :param path: the directory to list.
+    :return: a list of subdirectory names."""
+
+    with os.scandir(path) as entries:
+        return [entry.name for entry in entries if not entry.name.startswith('.') and entry.is_dir()]
+
+
+def load_novel_shape_classes(shape_class_dir='shape_classes/novel_shape_classes.json'):
+    """Loads (or creates and saves) the dictionary of shape and texture classifications
+    for each novel stimulus. Every combination of novel shape mask and Brodatz texture
+    is a stimulus.
+
+    :param shape_class_dir: location of the JSON file storing the dictionary.
+    :return: a dictionary indexed by stimulus name (eg. shape1-D4.png)."""
+
+    try:
+        return load_json(shape_class_dir)
+    except FileNotFoundError:
+        pass
+
+    shape_classes = {}
+    shapes = [name[:-4] for name in list_files('stimuli/novel-masks')]
+    textures = [name[:-4] for name in list_files('stimuli/brodatz-textures')]
+
+    for shape in shapes:
+        for texture in textures:
+            stimulus = '{0}-{1}.png'.format(shape, texture)
+
+            shape_classes[stimulus] = {'shape': shape, 'texture': texture,
+                                       'dir': '{0}/{1}'.format(shape, stimulus)}
+
+    with open(shape_class_dir, 'w') as file:
+        json.dump(shape_classes, file)
+
+    return shape_classes
+
+
+def load_geirhos_shape_classes(stimuli_path='stimuli/geirhos-alpha0-size100-aligned',
+                               shape_class_dir='shape_classes/geirhos_shape_classes.json'):
+    """Loads (or creates and saves) the dictionary of shape and texture classifications
+    for each cue-conflict stimulus of Geirhos et al.
+
+    :param stimuli_path: location of the original Geirhos stimuli, organized into one
+                         directory per shape class.
+    :param shape_class_dir: location of the JSON file storing the dictionary.
+    :return: a dictionary indexed by stimulus name (eg. airplane1-bicycle2.png)."""
+
+    try:
+        return load_json(shape_class_dir)
+    except FileNotFoundError:
+        pass
+
+    shape_classes = {}
+
+    for shape in list_dirs(stimuli_path):  # Shape class of image
+        for image in list_files(os.path.join(stimuli_path, shape), '.png'):
+            match = stimulus_name_pattern.match(image)
+
+            if not match:
+                continue
+
+            shape_spec, texture_spec = match.groups()  # Specific instances, eg. airplane1, clock2
+            texture = texture_spec.rstrip('0123456789')  # Texture class
+
+            if shape != texture:  # Filter images that are not cue-conflict
+                shape_classes[image] = {'shape': shape, 'texture': texture, 'shape_spec': shape_spec,
+                                        'texture_spec': texture_spec,
+                                        'dir': '{0}/{1}'.format(shape, image)}
+
+    # Save dictionary as a JSON file
+    with open(shape_class_dir, 'w') as file:
+        json.dump(shape_classes, file)
+
+    return shape_classes
+
+
+@lru_cache(maxsize=2)
+def load_background(bg_path, size):
+    """Loads a background image as RGBA, resized (nearest neighbour) to a given size.
+    Every stimulus in a set is placed over the same background, so resized backgrounds
+    are memoized rather than decoded and resized again per stimulus. Only the two most
+    recent (path, size) pairs are kept (the displaced and full-size variants), since
+    each stimulus set uses a single background. The returned image is shared; crop or
+    copy it before modifying it.
+
+    :param bg_path: location of the background image.
+    :param size: (width, height) to resize the background to.
+    :return: the resized RGBA background."""
+
+    return Image.open(bg_path).convert('RGBA').resize(size, Image.NEAREST)
+
+
+@lru_cache(maxsize=None)
+def load_silhouette_mask(mask_path):
+    """Loads a silhouette mask as an RGBA image. Black (silhouette) pixels are kept
+    as they are; every other pixel is made fully transparent, so that the alpha
+    channel of the returned mask can be used to paste a texture into the silhouette.
+
+    Many stimuli share a mask, so processed masks are memoized by path. The returned
+    image is shared and should not be modified in place.
+
+    :param mask_path: location of the mask image.
+    :return: the processed RGBA mask."""
+
+    mask = np.array(Image.open(mask_path).convert('RGBA'))
+    mask[mask[:, :, :3].any(axis=2)] = 0
+
+    return Image.fromarray(mask, 'RGBA')
+
+
+def generate_novel_triplets(shape_classes):
+    """Generates all triplets for the novel stimuli. A shape match has the same shape
+    as the anchor; a texture match has the same texture but a different shape.
+
+    :param shape_classes: dictionary of shape/texture classes for each image (see
+        load_novel_shape_classes).
+    :return: a dictionary (keyed by anchor image) of shape matches, texture matches and
+        triplets, and a list of all triplets."""
+
+    # Index images by shape and texture
+    by_shape = defaultdict(list)
+    by_texture = defaultdict(list)
+
+    for image in shape_classes.keys():
+        by_shape[shape_classes[image]['shape']].append(image)
+        by_texture[shape_classes[image]['texture']].append(image)
+
+    triplets_by_image = {}
+    all_triplets = []
+
+    for image in shape_classes.keys():  # Iterate over anchor images
+        shape = shape_classes[image]['shape']
+        texture = shape_classes[image]['texture']
+
+        triplets_by_image[image] = {}
+        triplets_by_image[image]['shape matches'] = [
+            match for match in by_shape[shape] if match != image]
+        triplets_by_image[image]['texture matches'] = [
+            match for match in by_texture[texture] if shape_classes[match]['shape'] != shape]
+        triplets_by_image[image]['triplets'] = [
+            [image, shape_match, texture_match] for shape_match, texture_match
+            in product(triplets_by_image[image]['shape matches'],
+                       triplets_by_image[image]['texture matches'])]
+        all_triplets.extend(triplets_by_image[image]['triplets'])
+
+    return triplets_by_image, all_triplets
+
+
+def generate_geirhos_triplets(shape_classes):
+    """Generates all triplets for the Geirhos stimuli. A shape match has the same specific
+    shape as the anchor but a different specific texture; a texture match has the same
+    specific texture but a different specific shape.
+
+    :param shape_classes: dictionary of shape/texture classes for each image (see
+        load_geirhos_shape_classes).
+    :return: a dictionary (keyed by anchor image) of shape matches, texture matches and
+        triplets, and a list of all triplets."""
+
+    # Index images by specific shape and specific texture instance
+    by_shape_spec = defaultdict(list)
+    by_texture_spec = defaultdict(list)
+
+    for image in shape_classes.keys():
+        by_shape_spec[shape_classes[image]['shape_spec']].append(image)
+        by_texture_spec[shape_classes[image]['texture_spec']].append(image)
+
+    triplets_by_image = {}
+    all_triplets = []
+
+    for image in shape_classes.keys():  # Iterate over anchor images
+        shape_spec = shape_classes[image]['shape_spec']
+        texture_spec = shape_classes[image]['texture_spec']
+
+        triplets_by_image[image] = {}
+        triplets_by_image[image]['shape matches'] = [
+            match for match in by_shape_spec[shape_spec]
+            if shape_classes[match]['texture_spec'] != texture_spec]
+        triplets_by_image[image]['texture matches'] = [
+            match for match in by_texture_spec[texture_spec]
+            if shape_classes[match]['shape_spec'] != shape_spec]
+        triplets_by_image[image]['triplets'] = [
+            [image, shape_match, texture_match] for shape_match, texture_match
+            in product(triplets_by_image[image]['shape matches'],
+                       triplets_by_image[image]['texture matches'])]
+        all_triplets.extend(triplets_by_image[image]['triplets'])
+
+    return triplets_by_image, all_triplets
+
 
 class SilhouetteTriplets(Dataset):
     """This class provides a way to generate and access all possible triplets of
@@ -82,59 +322,19 @@ class SilhouetteTriplets(Dataset):
 
         # Create/load dictionaries containing shape and texture classifications for each image
         if self.novel:
-            shape_class_dir = 'shape_classes/novel_shape_classes.json'
-
-            try:
-                # Load dictionary
-                self.shape_classes = json.load(open(shape_class_dir))
-
-            except FileNotFoundError:
-                shapes = [os.path.basename(x)[:-4] for x in glob.glob('stimuli/novel-masks/*')]
-                textures = [os.path.basename(x)[:-4] for x in glob.glob('stimuli/brodatz-textures/*')]
-
-                for shape in shapes:
-                    for texture in textures:
-                        stimulus = '{0}-{1}.png'.format(shape, texture)
-
-                        self.shape_classes[stimulus] = {'shape': shape, 'texture': texture,
-                                                   'dir': '{0}/{1}'.format(shape, stimulus)}
-
-                with open(shape_class_dir, 'w') as file:
-                    json.dump(self.shape_classes, file)
+            self.shape_classes = load_novel_shape_classes()
 
             # Generate/load triplets
             triplet_dir = 'novel_triplets.json'
 
             try:
                 # Load triplets
-                self.triplets_by_image = json.load(open(triplet_dir))
+                self.triplets_by_image = load_json(triplet_dir)
                 self.all_triplets = self.triplets_by_image['all']
                 self.triplets_by_image.pop('all')
 
             except FileNotFoundError:
-                for image in self.shape_classes.keys():  # Iterate over anchor images
-                    shape = self.shape_classes[image]['shape']
-                    texture = self.shape_classes[image]['texture']
-
-                    self.triplets_by_image[image] = {}
-                    self.triplets_by_image[image]['shape matches'] = []
-                    self.triplets_by_image[image]['texture matches'] = []
-                    self.triplets_by_image[image]['triplets'] = []
-
-                    for potential_match in self.shape_classes.keys():
-                        if potential_match == image:
-                            continue
-                        elif self.shape_classes[potential_match]['shape'] == shape:
-                            self.triplets_by_image[image]['shape matches'].append(potential_match)
-                        elif self.shape_classes[potential_match]['texture'] == texture:
-                            self.triplets_by_image[image]['texture matches'].append(potential_match)
-
-                    for shape_match in self.triplets_by_image[image]['shape matches']:
-                        for texture_match in self.triplets_by_image[image]['texture matches']:
-                            triplet = [image, shape_match, texture_match]
-                            self.triplets_by_image[image]['triplets'].append(triplet)
-                            self.all_triplets.append(triplet)
-
+                self.triplets_by_image, self.all_triplets = generate_novel_triplets(self.shape_classes)
                 self.triplets_by_image['all'] = self.all_triplets
 
                 # Save dictionary as a JSON file
@@ -144,68 +344,19 @@ class SilhouetteTriplets(Dataset):
             self.create_silhouette_stimuli()
 
         else:
-            shape_class_dir = 'shape_classes/geirhos_shape_classes.json'
-
-            try:
-                # Load dictionary
-                self.shape_classes = json.load(open(shape_class_dir))
-
-            except FileNotFoundError:
-                # Create dictionary
-                for image_dir in glob.glob('stimuli/geirhos-alpha0-size100-aligned/*/*.png'):
-                    image = image_dir.split('/')
-                    shape = image[2]  # Shape class of image
-                    texture_spec = image[3].split('-')[1].replace('.png', '')  # Specific texture instance, eg. clock2
-                    shape_spec = image[3].split('-')[0]  # Specific shape instance, eg. airplane1
-                    texture = ''.join([i for i in texture_spec if not i.isdigit()])  # Texture class
-
-                    if shape != texture:  # Filter images that are not cue-conflict
-                        self.shape_classes[image[3]] = {}  # Initialize dictionary for single image
-                        self.shape_classes[image[3]]['shape'] = shape
-                        self.shape_classes[image[3]]['texture'] = texture
-                        self.shape_classes[image[3]]['shape_spec'] = shape_spec
-                        self.shape_classes[image[3]]['texture_spec'] = texture_spec
-                        self.shape_classes[image[3]]['dir'] = '{0}/{1}'.format(shape, image[3])
-
-                # Save dictionary as a JSON file
-                with open(shape_class_dir, 'w') as file:
-                    json.dump(self.shape_classes, file)
+            self.shape_classes = load_geirhos_shape_classes()
 
             # Generate/load triplets
             triplet_dir = 'geirhos_triplets.json'
 
             try:
                 # Load triplets
-                self.triplets_by_image = json.load(open(triplet_dir))
+                self.triplets_by_image = load_json(triplet_dir)
                 self.all_triplets = self.triplets_by_image['all']
                 self.triplets_by_image.pop('all')
 
             except FileNotFoundError:
-                # Generate triplets
-                for image in self.shape_classes.keys(): # Iterate over anchor images
-                    shape_spec = self.shape_classes[image]['shape_spec']
-                    texture_spec = self.shape_classes[image]['texture_spec']
-
-                    self.triplets_by_image[image] = {}
-                    self.triplets_by_image[image]['shape matches'] = []
-                    self.triplets_by_image[image]['texture matches'] = []
-                    self.triplets_by_image[image]['triplets'] = []
-
-                    for potential_match in self.shape_classes.keys():
-                        if potential_match == image:
-                            continue
-                        elif self.shape_classes[potential_match]['shape_spec'] == shape_spec:
-                            if self.shape_classes[potential_match]['texture_spec'] != texture_spec:
-                                self.triplets_by_image[image]['shape matches'].append(potential_match)
-                        elif self.shape_classes[potential_match]['texture_spec'] == texture_spec:
-                            self.triplets_by_image[image]['texture matches'].append(potential_match)
-
-                    for shape_match in self.triplets_by_image[image]['shape matches']:
-                        for texture_match in self.triplets_by_image[image]['texture matches']:
-                            triplet = [image, shape_match, texture_match]
-                            self.triplets_by_image[image]['triplets'].append(triplet)
-                            self.all_triplets.append(triplet)
-
+                self.triplets_by_image, self.all_triplets = generate_geirhos_triplets(self.shape_classes)
                 self.triplets_by_image['all'] = self.all_triplets
 
                 # Save dictionary as a JSON file
@@ -214,6 +365,9 @@ class SilhouetteTriplets(Dataset):
 
             self.create_silhouette_stimuli()
 
+        # Fixed index -> image name ordering used by __getitem__
+        self.images = list(self.shape_classes.keys())
+
     def create_silhouette_stimuli(self):
         """Create and save the silhouette stimuli if they do not already exist."""
         try:
@@ -224,141 +378,159 @@ class SilhouetteTriplets(Dataset):
             else:
                 return
 
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count())) as executor:
+            # PIL releases the GIL while decoding, compositing and saving images
+            list(executor.map(self._create_stimulus, self.shape_classes.keys()))
+
+    def _create_stimulus(self, im_name):
+        """Create and save a single silhouette stimulus.
+
+        :param im_name: the name of the stimulus to create, eg. cat4-truck3.png."""
+
         if self.novel:
             mask_dir = 'stimuli/novel-masks'
         else:
             mask_dir = 'stimuli/geirhos-masks'
 
-        for im_name in self.shape_classes.keys():
+        try:
+            os.mkdir('stimuli/{0}/{1}'.format(self.stimuli_dir,
+                                              self.shape_classes[im_name]['shape']))
+        except FileExistsError:
+            pass
 
-            try:
-                os.mkdir('stimuli/{0}/{1}'.format(self.stimuli_dir,
-                                                  self.shape_classes[im_name]['shape']))
-            except FileExistsError:
-                pass
+        im_path = 'stimuli/{0}/{1}'.format(self.stimuli_dir,
+                                           self.shape_classes[im_name]['dir'])
+        if self.novel:
+            mask_path = '{0}/{1}.png'.format(mask_dir, self.shape_classes[im_name]['shape'])
+        else:
+            mask_path = '{0}/{1}/{2}.png'.format(mask_dir, self.shape_classes[im_name]['shape'],
+                                                 self.shape_classes[im_name]['shape_spec'])
 
-            im_path = 'stimuli/{0}/{1}'.format(self.stimuli_dir,
-                                               self.shape_classes[im_name]['dir'])
-            if self.novel:
-                mask_path = '{0}/{1}.png'.format(mask_dir, self.shape_classes[im_name]['shape'])
-            else:
-                mask_path = '{0}/{1}/{2}.png'.format(mask_dir, self.shape_classes[im_name]['shape'],
-                                                     self.shape_classes[im_name]['shape_spec'])
+        mask = load_silhouette_mask(mask_path)
 
-            mask = Image.open(mask_path).convert('RGBA')
+        if self.bg:
+            if self.displace_bg:
+                bg = load_background(self.bg, (mask.size[0] * 2, mask.size[0] * 2))
+                x = randint(0, 224)
+                y = randint(0, 224)
+                bg = bg.crop((x, y, x + mask.size[0], y + mask.size[0])).filter(ImageFilter.SHARPEN)
+            else:
+                bg = load_background(self.bg, (224, 224)).copy()
+            bg.putalpha(255 - self.alpha)
 
-            if self.bg:
-                if self.displace_bg:
-                    bg = Image.open(self.bg).convert('RGBA').resize((mask.size[0] * 2, mask.size[0] * 2), Image.NEAREST)
-                    x = randint(0, 224)
-                    y = randint(0, 224)
-                    bg = bg.crop((x, y, x + mask.size[0], y + mask.size[0])).filter(ImageFilter.SHARPEN)
-                else:
-                    bg = Image.open(self.bg).convert('RGBA').resize((224, 224), Image.NEAREST)
-                bg.putalpha(255 - self.alpha)
+            if self.blur != 0:
+                bg = bg.filter(ImageFilter.GaussianBlur(radius=self.blur))
+        else:
+            bg = Image.new('RGBA', (224, 224), (255, 255, 255, 255-self.alpha))
 
-                if self.blur != 0:
-                    bg = bg.filter(ImageFilter.GaussianBlur(radius=self.blur))
+        if self.novel:
+            texture_path = 'stimuli/brodatz-textures/{0}.png'.format(self.shape_classes[im_name]['texture'])
+            texture = Image.open(texture_path).resize((mask.size[0] * 2, mask.size[0] * 2))
+
+            # Attain a randomly selected patch of texture
+            bound = texture.size[0] - mask.size[0]
+            x = randint(0, bound)
+            y = randint(0, bound)
+            texture = texture.crop((x, y, x + mask.size[0], y + mask.size[0]))
+
+            # Place mask over texture
+            base = Image.new('RGBA', mask.size, (255, 255, 255, 0))
+            base.paste(texture, mask=mask.split()[3])
+
+            # Resize stimulus if necessary
+            if self.percent != '100':
+                resized = base.resize(self.stimulus_size, Image.NEAREST)
+                base = Image.new('RGBA', mask.size, (255, 255, 255, 255))
+
+                img_w, img_h = resized.size
+                bg_w, bg_h = base.size
+                offset = ((bg_w - img_w) // 2, (bg_h - img_h) // 2)
+
+                base.paste(resized, offset)
+                base = base.crop((offset[0], offset[1],
+                                  offset[0] + self.stimulus_size[0],
+                                  offset[1] + self.stimulus_size[0]))
+                '''
+                mask = base
+
+                width, height = mask.size
+
+                x = (width - self.stimulus_size[0]) // 2
+                y = (height - self.stimulus_size[0]) // 2
+
+                mask = mask.crop((x, y, x + self.stimulus_size[0], y + self.stimulus_size[0]))
+                '''
+
+            if self.unaligned:
+                bound = bg.size[0] - base.size[0]
+                x = randint(0, bound)  # not shape aligned when uncommented
+                y = randint(0, bound)  # not shape aligned when uncommented
+                bg.paste(base.convert('RGB'), (x, y), mask=base)
             else:
-                bg = Image.new('RGBA', (224, 224), (255, 255, 255, 255-self.alpha))
+                x = (224 - self.stimulus_size[0]) // 2  # shape aligned if uncommented
+                bg.paste(base.convert('RGB'), (x, x), mask=base)
 
-            if self.novel:
-                texture_path = 'stimuli/brodatz-textures/{0}.png'.format(self.shape_classes[im_name]['texture'])
-                texture = Image.open(texture_path).resize((mask.size[0] * 2, mask.size[0] * 2))
+            bg.save(im_path)
 
-                # Attain a randomly selected patch of texture
-                bound = texture.size[0] - mask.size[0]
+        else:
+            # Masks are placed first, then resizing is done afterwards
+            if not self.bg:
+                texture_path = 'stimuli/geirhos-alpha0.0-size100-aligned/{0}'.format(
+                    self.shape_classes[im_name]['dir'])
+            else:
+                texture_path = 'stimuli/geirhos-alpha1-size100-aligned/{0}'.format(
+                    self.shape_classes[im_name]['dir'])
+            texture = Image.open(texture_path)
+
+            base = Image.new('RGBA', mask.size, (255, 255, 255, 0))
+            base.paste(texture, mask=mask.split()[3])
+
+            # Resize
+            if self.percent != '100':
+                base = base.resize(self.stimulus_size)
+            if self.unaligned:
+                bound = bg.size[0] - self.stimulus_size[0]
                 x = randint(0, bound)
                 y = randint(0, bound)
-                texture = texture.crop((x, y, x + mask.size[0], y + mask.size[0]))
-
-                # Place mask over texture
-                mask_data = mask.getdata()
-
-                new_data = []
-                for item in mask_data:
-                    if item[0] == 0 and item[1] == 0 and item[2] == 0:
-                        new_data.append(item)
-                    else:
-                        new_data.append((0, 0, 0, 0))
-
-                mask.putdata(new_data)
-
-                base = Image.new('RGBA', mask.size, (255, 255, 255, 0))
-                base.paste(texture, mask=mask.split()[3])
+                bg.paste(base.convert('RGB'), (x, y), mask=base)
+            else:
+                x = (224 - self.stimulus_size[0]) // 2  # shape aligned if uncommented
+                bg.paste(base.convert('RGB'), (x, x), mask=base)
 
-                # Resize stimulus if necessary
-                if self.percent != '100':
-                    resized = base.resize(self.stimulus_size, Image.NEAREST)
-                    base = Image.new('RGBA', mask.size, (255, 255, 255, 255))
+            bg.save(im_path)
 
-                    img_w, img_h = resized.size
-                    bg_w, bg_h = base.size
-                    offset = ((bg_w - img_w) // 2, (bg_h - img_h) // 2)
+    def load_image(self, name):
+        """Decodes a single stimulus as an RGB image. If the dataset's transform is a
+        torchvision v2 transform, the stimulus is decoded straight into a uint8 tensor
+        without going through PIL; otherwise (eg. CLIP or ViT preprocessing), a PIL
+        image is returned. The file is closed as soon as it has been read rather than
+        whenever the image is garbage collected.
 
-                    base.paste(resized, offset)
-                    base = base.crop((offset[0], offset[1],
-                                      offset[0] + self.stimulus_size[0],
-                                      offset[1] + self.stimulus_size[0]))
-                    '''
-                    mask = base
+        :param name: the name of the stimulus, eg. cat4-truck3.png.
+        :return: the decoded image."""
 
-                    width, height = mask.size
+        path = 'stimuli/{0}/{1}'.format(self.stimuli_dir, self.shape_classes[name]['dir'])
 
-                    x = (width - self.stimulus_size[0]) // 2
-                    y = (height - self.stimulus_size[0]) // 2
+        if isinstance(self.transform, v2.Transform):
+            return read_image(path, mode=ImageReadMode.RGB)
 
-                    mask = mask.crop((x, y, x + self.stimulus_size[0], y + self.stimulus_size[0]))
-                    '''
+        # Stimuli are always saved as PNGs, so skip probing the other image plugins
+        with Image.open(path, formats=['PNG']) as im:
+            return im.convert('RGB')
 
-                if self.unaligned:
-                    bound = bg.size[0] - base.size[0]
-                    x = randint(0, bound)  # not shape aligned when uncommented
-                    y = randint(0, bound)  # not shape aligned when uncommented
-                    bg.paste(base.convert('RGB'), (x, y), mask=base)
-                else:
-                    x = (224 - self.stimulus_size[0]) // 2  # shape aligned if uncommented
-                    bg.paste(base.convert('RGB'), (x, x), mask=base)
+    def apply_transform(self, im):
+        """Applies the dataset's transforms (if any) to a decoded image.
 
-                bg.save(im_path)
+        :param im: an RGB image.
+        :return: the image with transforms applied."""
 
+        if self.transform:
+            if type(self.transform) == transformers.models.vit.feature_extraction_vit.ViTFeatureExtractor:
+                im = self.transform(images=im, return_tensors="pt")
             else:
-                # Masks are placed first, then resizing is done afterwards
-                mask_data = mask.getdata()
-
-                new_data = []
-                for item in mask_data:
-                    if item[0] == 0 and item[1] == 0 and item[2] == 0:
-                        new_data.append(item)
-                    else:
-                        new_data.append((0, 0, 0, 0))
-
-                mask.putdata(new_data)
-
-                if not self.bg:
-                    texture_path = 'stimuli/geirhos-alpha0.0-size100-aligned/{0}'.format(
-                        self.shape_classes[im_name]['dir'])
-                else:
-                    texture_path = 'stimuli/geirhos-alpha1-size100-aligned/{0}'.format(
-                        self.shape_classes[im_name]['dir'])
-                texture = Image.open(texture_path)
-
-                base = Image.new('RGBA', mask.size, (255, 255, 255, 0))
-                base.paste(texture, mask=mask.split()[3])
-
-                # Resize
-                if self.percent != '100':
-                    base = base.resize(self.stimulus_size)
-                if self.unaligned:
-                    bound = bg.size[0] - self.stimulus_size[0]
-                    x = randint(0, bound)
-                    y = randint(0, bound)
-                    bg.paste(base.convert('RGB'), (x, y), mask=base)
-                else:
-                    x = (224 - self.stimulus_size[0]) // 2  # shape aligned if uncommented
-                    bg.paste(base.convert('RGB'), (x, x), mask=base)
+                im = self.transform(im)
 
-                bg.save(im_path)
+        return im
 
     def __getitem__(self, idx):
         """For a given singular index, returns the singular image corresponding to that index.
@@ -366,21 +538,13 @@ class SilhouetteTriplets(Dataset):
         :param idx: a singular integer index.
         :return: the image with transforms applied and the image name."""
 
-        name = list(self.shape_classes.keys())[idx]
-        path = 'stimuli/{0}/{1}'.format(self.stimuli_dir, self.shape_classes[name]['dir'])
-
-        im = Image.open(path).convert('RGB')
-
-        if self.transform:
-            if type(self.transform) == transformers.models.vit.feature_extraction_vit.ViTFeatureExtractor:
-                im = self.transform(images=im, return_tensors="pt")
-            else:
-                im = self.transform(im)
+        name = self.images[idx]
+        im = self.apply_transform(self.load_image(name))
 
         return im, name
 
     def __len__(self):
-        return len(self.shape_classes.keys())
+        return len(self.images)
 
     def getitem(self, triplet):
         """For a given (anchor, shape match, texture match) triplet, loads and returns
@@ -391,37 +555,21 @@ class SilhouetteTriplets(Dataset):
 
         :return: the anchor, shape match, and texture match images with transforms applied."""
 
-        s_dir = 'stimuli/{0}'.format(self.stimuli_dir)
+        ims = []
 
-        anchor_path = '{0}/{1}/{2}'.format(s_dir, self.shape_classes[triplet[0]]['shape'], triplet[0])
-        shape_path = '{0}/{1}/{2}'.format(s_dir, self.shape_classes[triplet[1]]['shape'], triplet[1])
-        texture_path = '{0}/{1}/{2}'.format(s_dir, self.shape_classes[triplet[2]]['shape'], triplet[2])
+        for name in triplet:
+            im = self.apply_transform(self.load_image(name))
 
-        # Load images
-        anchor_im = Image.open(anchor_path).convert('RGB')
-        shape_im = Image.open(shape_path).convert('RGB')
-        texture_im = Image.open(texture_path).convert('RGB')
-
-        # Apply transforms
-        if self.transform:
-            if type(self.transform) == transformers.models.vit.feature_extraction_vit.ViTFeatureExtractor:
-                anchor_im = self.transform(images=anchor_im, return_tensors="pt")
-                anchor_im['pixel_values'] = anchor_im['pixel_values'].unsqueeze(0)
-
-                shape_im = self.transform(images=shape_im, return_tensors="pt")
-                shape_im['pixel_values'] = shape_im['pixel_values'].unsqueeze(0)
-
-                texture_im = self.transform(images=texture_im, return_tensors="pt")
-                texture_im['pixel_values'] = texture_im['pixel_values'].unsqueeze(0)
-            else:
-                anchor_im = self.transform(anchor_im)
-                anchor_im = anchor_im.unsqueeze(0)
+            # Add a batch dimension
+            if self.transform:
+                if type(self.transform) == transformers.models.vit.feature_extraction_vit.ViTFeatureExtractor:
+                    im['pixel_values'] = im['pixel_values'].unsqueeze(0)
+                else:
+                    im = im.unsqueeze(0)
 
-                shape_im = self.transform(shape_im)
-                shape_im = shape_im.unsqueeze(0)
+            ims.append(im)
 
-                texture_im = self.transform(texture_im)
-                texture_im = texture_im.unsqueeze(0)
+        anchor_im, shape_im, texture_im = ims
 
         return anchor_im, shape_im, texture_im
 
@@ -458,9 +606,9 @@ class SilhouetteTriplets(Dataset):
                  each anchor image has an equal number of triplets."""
 
         if self.novel:
-            selections = json.load(open('novel_seed{}.json'.format(self.num_triplets)))
+            selections = load_json('novel_seed{}.json'.format(self.num_triplets))
         else:
-            selections = json.load(open('seed{}.json'.format(self.num_triplets)))
+            selections = load_json('seed{}.json'.format(self.num_triplets))
 
         return selections[str(draw)]
 
@@ -35,42 +35,41 @@ def csv_class_values(shape_dict, shape_categories, shape_spec_dict, csv_dir):
         the specific textures for a given shape (eg. clock1, oven2, instead of
         just clock, oven, etc). This ensures that results for clock1 and clock2
         for example do not overwrite each other.
-    :param csv_dir: directory for storing the CSV."""
+    :param csv_dir: directory for storing the CSVs."""
 
     columns = ['Shape', 'Texture', 'Decision', 'Shape Category Value', 'Texture Category Value',
                'Decision Category Value', 'Shape Decision', 'Texture Decision', 'Neither',
                'Restricted Decision', 'Restriced Shape Value', 'Restricted Texture Value',
                'Restricted Shape Decision', 'Restricted Texture Decision']
 
-    for shape in shape_categories:
-        specific_textures = shape_spec_dict[shape]
-        df = pd.DataFrame(index=range(len(specific_textures)), columns=columns)
-        df['Shape'] = shape
-
-        for i, row in df.iterrows():
-            texture = specific_textures[i]
-            decision = shape_dict[shape][texture + '0'][0]
-            class_values = shape_dict[shape][texture + '0'][1]
-            decision_restricted = shape_dict[shape][texture + '0'][2]
-            restricted_class_values = shape_dict[shape][texture + '0'][3]
-
-            row['Texture'] = texture
-            row['Decision'] = decision
-            row['Shape Category Value'] = class_values[shape_categories.index(shape)]
-            row['Texture Category Value'] = class_values[shape_categories.index(texture[:-1:])]
-            row['Decision Category Value'] = class_values[shape_categories.index(decision)]
-
-            row['Shape Decision'] = int(decision == shape)
-            row['Texture Decision'] = int(decision == texture[:-1:])
-            row['Neither'] = int(decision != shape and decision != texture[:-1:])
-
-            row['Restricted Decision'] = decision_restricted
-            row['Restricted Shape Decision'] = int(shape == decision_restricted)
-
-            row['Restricted Texture Decision'] = int(texture[:-1:] == decision_restricted)
-            row['Restricted Shape Value'] = restricted_class_values[0]
-            row['Restricted Texture Value'] = restricted_class_values[1]
+    cat2idx = {category: idx for idx, category in enumerate(shape_categories)}
 
+    for shape in shape_categories:
+        shape_idx = cat2idx[shape]
+        rows = []
+
+        for texture in shape_spec_dict[shape]:
+            decision, class_values, decision_restricted, restricted_class_values = shape_dict[shape][texture + '0']
+            texture_root = texture[:-1]
+
+            rows.append({
+                'Shape': shape,
+                'Texture': texture,
+                'Decision': decision,
+                'Shape Category Value': class_values[shape_idx],
+                'Texture Category Value': class_values[cat2idx[texture_root]],
+                'Decision Category Value': class_values[cat2idx[decision]],
+                'Shape Decision': int(decision == shape),
+                'Texture Decision': int(decision == texture_root),
+                'Neither': int(decision != shape and decision != texture_root),
+                'Restricted Decision': decision_restricted,
+                'Restriced Shape Value': float(restricted_class_values[0]),
+                'Restricted Texture Value': float(restricted_class_values[1]),
+                'Restricted Shape Decision': int(shape == decision_restricted),
+                'Restricted Texture Decision': int(texture_root == decision_restricted)
+            })
+
+        df = pd.DataFrame(rows, columns=columns)
         df.to_csv(csv_dir + '/' + shape + '.csv', index=False)
 
 
@@ -80,7 +79,8 @@ def calculate_totals(shape_categories, result_dir):
     results in a CSV and optionally prints them out.
 
     :param shape_categories: a list of Geirhos shape classes.
-    :param result_dir: where to store the results."""
+    :param result_dir: where the results from csv_class_values are, and where
+        to store the totals."""
 
     shape_dict = dict.fromkeys(shape_categories)
     texture_dict = dict.fromkeys(shape_categories)
@@ -100,22 +100,23 @@ def calculate_totals(shape_categories, result_dir):
         restricted_shape_dict[shape] = 0
         restricted_texture_dict[shape] = 0
 
-    for filename in os.listdir(result_dir):
-        if filename[-4:] != '.csv' or filename == 'totals.csv' or filename == 'proportions_avg.csv':
-            continue
+    csv_files = [result_dir + '/' + shape + '.csv' for shape in shape_categories]
+    df = pd.concat([pd.read_csv(file) for file in csv_files if os.path.exists(file)], ignore_index=True)
 
-        df = pd.read_csv(result_dir + '/' + filename)
-        shape = df['Shape'][0]
-        for i, row in df.iterrows():
-            if row['Restricted Shape Decision'] != row['Restricted Texture Decision']:
-                shape_dict[shape] = shape_dict[shape] + row['Shape Decision']
-                texture_dict[shape] += row['Texture Decision']
-                neither_dict[shape] += row['Neither']
-                restricted_shape_dict[shape] += row['Restricted Shape Decision']
-                restricted_texture_dict[shape] += row['Restricted Texture Decision']
+    # Only count stimuli where the restricted decision favored exactly one of shape or texture
+    sub = df.loc[df['Restricted Shape Decision'] != df['Restricted Texture Decision']]
+    counts = sub.groupby('Shape')[['Shape Decision', 'Texture Decision', 'Neither',
+                                   'Restricted Shape Decision', 'Restricted Texture Decision']].sum()
 
-    for shape in shape_categories:
-        shape_idx = shape_categories.index(shape)
+    for shape, shape_count, texture_count, neither_count, restricted_shape_count, restricted_texture_count \
+            in counts.itertuples(name=None):
+        shape_dict[shape] += int(shape_count)
+        texture_dict[shape] += int(texture_count)
+        neither_dict[shape] += int(neither_count)
+        restricted_shape_dict[shape] += int(restricted_shape_count)
+        restricted_texture_dict[shape] += int(restricted_texture_count)
+
+    for shape_idx, shape in enumerate(shape_categories):
         result_df.at[shape_idx, 'Shape Category'] = shape
         result_df.at[shape_idx, 'Number Shape Decisions'] = shape_dict[shape]
         result_df.at[shape_idx, 'Number Texture Decisions'] = texture_dict[shape]
@@ -162,18 +163,10 @@ def calculate_proportions(model_type, result_dir):
     texture_all = texture / total
 
     columns = ['Model', 'Metric', 'Shape Match Closer', 'Texture Match Closer']
-    metrics = ['no_neither', 'neither', 'restricted']
-    results = pd.DataFrame(index=range(len(metrics)), columns=columns)
-
-    results.at[:, 'Model'] = model_type
-    for i in range(len(metrics)):
-        results.at[i, 'Metric'] = metrics[i]
-    results.at[0, 'Shape Match Closer'] = shape_texture
-    results.at[0, 'Texture Match Closer'] = texture_shape
-    results.at[1, 'Shape Match Closer'] = shape_all
-    results.at[1, 'Texture Match Closer'] = texture_all
-    results.at[2, 'Shape Match Closer'] = shape_restricted
-    results.at[2, 'Texture Match Closer'] = texture_restricted
+    results = pd.DataFrame([[model_type, 'no_neither', shape_texture, texture_shape],
+                            [model_type, 'neither', shape_all, texture_all],
+                            [model_type, 'restricted', shape_restricted, texture_restricted]],
+                           columns=columns)
 
     '''
     strings = ["Proportion of shape decisions (disregarding 'neither' decisions): " + str(shape_texture),
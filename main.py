@@ -3,15 +3,18 @@ import torch
 import torch.nn as nn
 from PIL import Image
 from torchvision import models, transforms
+from torchvision.transforms import v2
 from transformers import ViTFeatureExtractor, ViTForImageClassification, ViTModel, logging, ViTConfig
 import transformers
 from torch.utils.data import DataLoader
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import os
 import json
 import numpy as np
 import pandas as pd
-from data import SilhouetteTriplets
+from data import SilhouetteTriplets, load_geirhos_shape_classes, load_novel_shape_classes
 from plot import make_plots
 from evaluate import *
 import clip
@@ -31,6 +34,7 @@ model_list = ['resnet50', 'resnet50_random', 'ViTB16', 'ViTB16_random',
 
 if torch.cuda.is_available():
     device = torch.device('cuda')
+    torch.backends.cudnn.benchmark = True  # input shapes are fixed, so let cuDNN pick the fastest conv algorithms
 elif torch.backends.mps.is_available() and torch.backends.mps.is_built():
     device = torch.device('mps')
 else:
@@ -54,6 +58,27 @@ class LinearClassifier(nn.Module):
         return self.linear(x)
 
 
+class ScriptedTransform:
+    """Runs a sequence of tensor transforms as a single TorchScript graph, so that the
+    per-image preprocessing does not go through Python dispatch for every step. The
+    graph is compiled up front, and again when unpickled, since ScriptModules cannot be
+    pickled (eg. when a dataset is sent to spawned DataLoader workers). Compiling
+    eagerly also means concurrent first calls never script the same module twice."""
+    def __init__(self, *transform_list):
+        self.transforms = nn.Sequential(*transform_list)
+        self.scripted = torch.jit.script(self.transforms)
+
+    def __call__(self, im):
+        return self.scripted(im)
+
+    def __getstate__(self):
+        return {'transforms': self.transforms}
+
+    def __setstate__(self, state):
+        self.transforms = state['transforms']
+        self.scripted = torch.jit.script(self.transforms)
+
+
 def get_model_list():
     return model_list
 
@@ -162,7 +187,8 @@ def get_embeddings(args, stimuli_dir, model_type, penult_model, transform, repla
         embedding_dict = {}
 
         dataset = SilhouetteTriplets(args, stimuli_dir, transform)
-        data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+        data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False,
+                                 num_workers=args.num_workers, pin_memory=torch.cuda.is_available())
 
         with torch.no_grad():
             # Iterate over images
@@ -305,10 +331,10 @@ def bg_match_simulations(args, stimuli_dir, model_type, penult_model, transform,
         quadruplets = json.load(open(quadruplet_dir))
     else:
         if args.novel:
-            shape_classes = json.load(open('shape_classes/novel_shape_classes.json'))
+            shape_classes = load_novel_shape_classes()
             triplets = json.load(open('novel_triplets.json'))
         else:
-            shape_classes = json.load(open('shape_classes/geirhos_shape_classes.json'))
+            shape_classes = load_geirhos_shape_classes()
             triplets = json.load(open('geirhos_triplets.json'))
 
         bg_counter = 0
@@ -803,26 +829,34 @@ def initialize_model(model_type, n=-1):
              layer removed, and the correct transforms for the model (using statistics
              calculated from the specific model's training data)."""
 
-    # These are the ImageNet transforms; most models will use these, but a few redefine them
-    transform = transforms.Compose([
-        transforms.Resize(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+    # These are the ImageNet transforms; most models will use these, but a few redefine them.
+    # Images are resized, converted to uint8 tensors, then normalized in one compiled graph.
+    # SilhouetteTriplets decodes stimuli directly into uint8 tensors for v2 transforms, in which
+    # case PILToTensor passes them through. PIL images (eg. the 129x129 icons) are still resized
+    # by PIL before conversion, as before, so their embeddings are unchanged.
+    transform = v2.Compose([
+        v2.Resize(224, antialias=True),
+        v2.PILToTensor(),
+        ScriptedTransform(
+            transforms.ConvertImageDtype(torch.float32),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ),
     ])
 
     if model_type == 'saycam':
         # Load Emin Ohran's pretrained SAYCAM model + ImageNet classifier from its .tar file
         model = models.resnext50_32x4d(pretrained=True)
         model.fc = nn.Linear(in_features=2048, out_features=1000, bias=True)
-        model = nn.DataParallel(model)
         checkpoint = torch.load('models/fz_IN_resnext50_32x4d_augmentation_True_SAY_5_288.tar',
                                 map_location=device)
-        model.load_state_dict(checkpoint['model_state_dict'])
+        # The checkpoint was saved from a DataParallel wrapper; strip its prefix to load a bare model
+        checkpoint = {k.replace("module.", ""): v for k, v in checkpoint['model_state_dict'].items()}
+        model.load_state_dict(checkpoint)
     elif model_type == 'saycamS':
         model = models.resnext50_32x4d(pretrained=False)
-        model = nn.DataParallel(model)
         checkpoint = torch.load('models/TC-S.tar', map_location=torch.device('cpu'))
-        model.load_state_dict(checkpoint['model_state_dict'], strict=False)
+        checkpoint = {k.replace("module.", ""): v for k, v in checkpoint['model_state_dict'].items()}
+        model.load_state_dict(checkpoint, strict=False)
     elif model_type == 'resnet50':
         model = models.resnet50(pretrained=True)
     elif model_type == 'resnet50_random':
@@ -867,10 +901,7 @@ def initialize_model(model_type, n=-1):
     model.eval()
 
     # Remove the final layer from the model
-    if model_type == 'saycam' or model_type == 'saycamS':
-        modules = list(model.module.children())[:-1]
-        penult_model = nn.Sequential(*modules)
-    elif model_type == 'resnet50' or model_type == 'resnet50_random':
+    if model_type in ['saycam', 'saycamS', 'resnet50', 'resnet50_random']:
         modules = list(model.children())[:-1]
         penult_model = nn.Sequential(*modules)
     elif model_type == 'clipViTB16':
@@ -913,8 +944,31 @@ def clip_predictions(im, model, model_type):
     return similarity
 
 
+def compile_model(model, example_input):
+    """Compiles a model into CUDA graphs with torch.compile(mode='reduce-overhead') and runs
+    it once on an example batch, so that any compilation error surfaces here rather than in
+    the middle of a simulation. If the model cannot be compiled with this torch build or
+    platform, the eager model is returned instead.
+
+    :param model: the model to compile.
+    :param example_input: a batch with the shape that the model will be called with.
+
+    :return: the compiled model, or the original model if compilation failed."""
+
+    try:
+        compiled_model = torch.compile(model, mode='reduce-overhead')
+
+        with torch.inference_mode():
+            compiled_model(example_input)
+    except Exception as e:
+        print('Could not compile the model, running it eagerly instead: {0}'.format(e))
+        return model
+
+    return compiled_model
+
+
 def run_simulations(args, model_type, stimuli_dir, n=-1):
-    """By default: passes images one at a time through a given model and stores/plots the results
+    """By default: passes images in batches through a given model and stores/plots the results
     (the shape/texture of the image, the classification made, and whether or not
     the classifcation was a shape classification, a texture classification, or neither.)
 
@@ -1241,63 +1295,108 @@ def run_simulations(args, model_type, stimuli_dir, n=-1):
         shape_categories = sorted(['knife', 'keyboard', 'elephant', 'bicycle', 'airplane',
                                    'clock', 'oven', 'chair', 'bear', 'boat', 'cat',
                                    'bottle', 'truck', 'car', 'bird', 'dog'])
+        cat2idx = {category: idx for idx, category in enumerate(shape_categories)}
 
-        shape_dict = dict.fromkeys(shape_categories)  # for storing the results
-        shape_categories0 = [shape + '0' for shape in shape_categories]
-        shape_dict0 = dict.fromkeys(shape_categories0)
-
-        shape_spec_dict = dict.fromkeys(shape_categories)  # contains lists of specific textures for each shape
-        for shape in shape_categories:
-            shape_dict[shape] = shape_dict0.copy()
-            shape_spec_dict[shape] = []
+        # for storing the results
+        shape_dict = {shape: {texture + '0': None for texture in shape_categories} for shape in shape_categories}
+        # contains lists of specific textures for each shape
+        shape_spec_dict = {shape: [] for shape in shape_categories}
 
         dataset = SilhouetteTriplets(args, stimuli_dir, transform)
-        dataloader = DataLoader(dataset, batch_size=1, shuffle=False)
+        dataloader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False,
+                                num_workers=args.num_workers, pin_memory=torch.cuda.is_available())
 
         # Obtain ImageNet - Geirhos mapping
         mapping = probabilities_to_decision.ImageNetProbabilitiesTo16ClassesMapping()
-        softmax = nn.Softmax(dim=1)
-        softmax2 = nn.Softmax(dim=0)
 
-        with torch.no_grad():
-            # Pass images into the model one at a time
-            for batch in dataloader:
-                im, name = batch
-                split_name = name[0].split('-')
+        # Optionally run the forward passes in bfloat16 on GPUs that support it. The logits are
+        # cast back to float32 before the softmax and category mapping, but near-ties between
+        # categories can still be decided differently than in float32.
+        if args.bf16 and device.type == 'cuda' and torch.cuda.is_bf16_supported():
+            forward_context = torch.autocast(device_type='cuda', dtype=torch.bfloat16)
+        else:
+            forward_context = nullcontext()
 
-                shape = ''.join([i for i in split_name[0] if not i.isdigit()])
-                texture = ''.join([i for i in split_name[1][:-4] if not i.isdigit()])
-                texture_spec = split_name[1][:-4]
+        # Optionally capture the ResNet/ResNeXt classifiers as CUDA graphs. Every batch has the
+        # same shape except possibly the last, so this compiles at most twice.
+        if args.compile and device.type == 'cuda' and \
+                model_type in ['saycam', 'saycamS', 'resnet50', 'resnet50_random']:
+            example_input = torch.zeros((args.batch_size, *dataset[0][0].shape), device=device)
 
-                if model_type == 'ViTB16':
-                    output = model(**im)
-                    output = output.logits
-                elif model_type in clip_list:
-                    output = clip_predictions(im, model, model_type)
-                elif model_type == 'dino_resnet50' or model_type == 'swav':
-                    embed = penult_model(im)
-                    output = model(embed)
-                else:
-                    output = model(im)
+            with forward_context:
+                model = compile_model(model, example_input)
 
-                soft_output = softmax(output).detach().numpy().squeeze()
+        def record_batch(names, soft_outputs):
+            """Maps a batch of softmax outputs onto the 16 categories and stores the
+            decisions for each image in shape_dict and shape_spec_dict.
 
-                decision, class_values = mapping.probabilities_to_decision(soft_output)
+            :param names: the names of the images in the batch.
+            :param soft_outputs: a (batch size, 1000) array of ImageNet probabilities."""
+
+            decisions, batch_class_values = mapping.probabilities_to_decision_batch(soft_outputs)
+
+            for name, decision, class_values in zip(names, decisions, batch_class_values):
+                split_name = name.split('-')
+
+                texture_spec = split_name[1][:-4]
+                shape = ''.join([i for i in split_name[0] if not i.isdigit()])
+                texture = ''.join([i for i in texture_spec if not i.isdigit()])
 
-                shape_idx = shape_categories.index(shape)
-                texture_idx = shape_categories.index(texture)
-                if class_values[shape_idx] > class_values[texture_idx]:
+                shape_idx = cat2idx[shape]
+                texture_idx = cat2idx[texture]
+                shape_value = class_values[shape_idx]
+                texture_value = class_values[texture_idx]
+                if shape_value > texture_value:
                     decision_idx = shape_idx
                 else:
                     decision_idx = texture_idx
                 decision_restricted = shape_categories[decision_idx]
-                restricted_class_values = torch.Tensor([class_values[shape_idx], class_values[texture_idx]])
-                restricted_class_values = softmax2(restricted_class_values)
+
+                # Softmax over only the shape and texture category values
+                max_value = max(shape_value, texture_value)
+                restricted_class_values = np.exp([shape_value - max_value, texture_value - max_value])
+                restricted_class_values /= restricted_class_values.sum()
 
                 shape_dict[shape][texture_spec + '0'] = [decision, class_values,
                                                          decision_restricted, restricted_class_values]
                 shape_spec_dict[shape].append(texture_spec)
 
+        # On CUDA, batches are copied asynchronously from the DataLoader's pinned memory into
+        # one reused device buffer instead of allocating a new device tensor for every batch
+        input_buf = None
+
+        # A single worker records each batch while the next one runs through the model; having
+        # only one worker keeps the results in order without any locking
+        with torch.inference_mode(), ThreadPoolExecutor(max_workers=1) as executor:
+            futures = []
+
+            # Pass images into the model one batch at a time
+            for ims, names in dataloader:
+                if device.type == 'cuda' and torch.is_tensor(ims):
+                    if input_buf is None:
+                        input_buf = torch.empty_like(ims, device=device)
+                    ims = input_buf[:len(ims)].copy_(ims, non_blocking=True)
+
+                with forward_context:
+                    if model_type == 'ViTB16':
+                        ims['pixel_values'] = ims['pixel_values'].to(device).squeeze(1)
+                        output = model(**ims)
+                        output = output.logits
+                    elif model_type in clip_list:
+                        output = clip_predictions(ims.to(device), model, model_type)
+                    elif model_type == 'dino_resnet50' or model_type == 'swav':
+                        embed = penult_model(ims.to(device))
+                        output = model(embed)
+                    else:
+                        output = model(ims.to(device))
+
+                # Softmax the whole batch (in float32), then map it onto the 16 categories in the background
+                soft_outputs = torch.softmax(output.float(), dim=1).cpu().numpy()
+                futures.append(executor.submit(record_batch, names, soft_outputs))
+
+            for future in futures:
+                future.result()  # re-raises any error from recording a batch
+
             csv_class_values(shape_dict, shape_categories, shape_spec_dict, result_dir)
             calculate_totals(shape_categories, result_dir)
             calculate_proportions(model_type, result_dir)
@@ -1350,7 +1449,17 @@ if __name__ == '__main__':
                         type=int)
     parser.add_argument('--random_bg', help='Run simulations with randomly selected backgrounds for each triplet taken '
                                             'from the given directory.', default=None, required=False)
-    parser.add_argument('--batch_size', help='Size of batch to use if obtaining model embeddings.', default=64)
+    parser.add_argument('--batch_size', help='Size of batch to use if obtaining model embeddings or classifications.', default=64, type=int)
+    parser.add_argument('--compile', help='Compile the ResNet/ResNeXt classifiers with torch.compile when '
+                                          'obtaining classifications on a CUDA device.', required=False,
+                        action='store_true')
+    parser.add_argument('--bf16', help='Run the forward passes in bfloat16 when obtaining classifications on a '
+                                       'CUDA device that supports it. Near-ties between categories may be '
+                                       'decided differently than in float32.', required=False,
+                        action='store_true')
+    parser.add_argument('--num_workers', help='Number of DataLoader worker processes used to load stimuli when '
+                                              'obtaining model embeddings or classifications.',
+                        default=min(8, os.cpu_count()), type=int)
     args = parser.parse_args()
 
     model = args.model
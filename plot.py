@@ -1,7 +1,19 @@
+import matplotlib
+matplotlib.use('Agg')  # plots are only ever saved to file
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+# Line colors, legend labels, line styles, and markers for each model in get_model_list
+model_colors = ['#e274d0', '#e274d0', '#5ea6c6', '#5ea6c6',
+                '#57ad74', '#c69355', '#e6556c']
+model_labels = ['ResNet-50', 'ResNet-50 (Random)', 'ViT-B/16', 'ViT-B/16 (Random)',
+                'DINO ResNet-50', 'CLIP ViT-B/16', 'SAYCam-S']
+model_styles = ['solid', 'dashed', 'solid', 'dashed',
+                'solid', 'solid', 'solid']
+model_markers = ['o', 'o', '^', '^',
+                 'o', '^', 'o']
+
 
 def get_model_list():
     return ['resnet50', 'resnet50_random', 'ViTB16', 'ViTB16_random',
@@ -51,14 +63,10 @@ def plot_bias_vs_alpha(args, random=False):
     else:
         model_list = get_model_list()
 
-        colors = ['#e274d0', '#e274d0', '#5ea6c6', '#5ea6c6',
-                  '#57ad74', '#c69355', '#e6556c']
-        labels = ['ResNet-50', 'ResNet-50 (Random)', 'ViT-B/16', 'ViT-B/16 (Random)',
-                  'DINO ResNet-50', 'CLIP ViT-B/16', 'SAYCam-S']
-        styles = ['solid', 'dashed', 'solid', 'dashed',
-                  'solid', 'solid', 'solid']
-        markers = ['o', 'o', '^', '^',
-                   'o', '^', 'o']
+        colors = model_colors
+        labels = model_labels
+        styles = model_styles
+        markers = model_markers
 
     if args.novel:
         sim_dir = 'novel'
@@ -181,14 +189,10 @@ def plot_bias_vs_size(args, random=False):
     else:
         model_list = get_model_list()
 
-        colors = ['#e274d0', '#e274d0', '#5ea6c6', '#5ea6c6',
-                  '#57ad74', '#c69355', '#e6556c']
-        labels = ['ResNet-50', 'ResNet-50 (Random)', 'ViT-B/16', 'ViT-B/16 (Random)',
-                  'DINO ResNet-50', 'CLIP ViT-B/16', 'SAYCam-S']
-        styles = ['solid', 'dashed', 'solid', 'dashed',
-                  'solid', 'solid', 'solid']
-        markers = ['o', 'o', '^', '^',
-                   'o', '^', 'o']
+        colors = model_colors
+        labels = model_labels
+        styles = model_styles
+        markers = model_markers
 
     if args.novel:
         sim_dir = 'novel'
@@ -311,8 +315,6 @@ def plot_bias_vs_size(args, random=False):
 def plot_bg_match_bar_charts(args, random=False):
     palette = sns.color_palette("hls", 8)
     labels = ['Shape Bias', 'Texture Bias', 'Background Bias', 'Original Shape Bias']
-    model_labels = ['ResNet-50', 'ResNet-50 (Random)', 'ViT-B/16', 'ViT-B/16 (Random)',
-              'DINO ResNet-50', 'CLIP ViT-B/16', 'SAYCam-S']
 
     if random:
         model_list = ['{0}_{1}'.format(args.model, i) for i in range(1, args.N + 1)]
@@ -199,6 +199,18 @@ class ImageNetProbabilitiesTo16ClassesMapping(ProbabilitiesToDecisionMapping):
     def __init__(self, aggregation_function=np.mean):
 
         self.aggregation_function = aggregation_function
+        self.categories = get_human_object_recognition_categories()
+
+        # Category of every ImageNet class, for np.bincount; classes outside the
+        # 16 categories go into an extra bin (index 16) that is dropped afterwards
+        c = HumanCategories()
+        self.class_to_category = np.full(1000, len(self.categories))
+
+        for i, category in enumerate(self.categories):
+            indices = c.get_imagenet_indices_for_category(category)
+            self.class_to_category[indices] = i
+
+        self.category_sizes = np.bincount(self.class_to_category)[:len(self.categories)]
 
 
     def probabilities_to_decision(self, probabilities):
@@ -215,6 +227,13 @@ class ImageNetProbabilitiesTo16ClassesMapping(ProbabilitiesToDecisionMapping):
         self.check_input(probabilities)
         assert len(probabilities) == 1000
 
+        if self.aggregation_function is np.mean:
+            category_sums = np.bincount(self.class_to_category, weights=probabilities,
+                                        minlength=len(self.categories) + 1)
+            category_probs = list(category_sums[:len(self.categories)] / self.category_sizes)
+
+            return self.categories[int(np.argmax(category_probs))], category_probs
+
         max_value = -float("inf")
         category_decision = None
         c = HumanCategories()
@@ -235,3 +254,32 @@ class ImageNetProbabilitiesTo16ClassesMapping(ProbabilitiesToDecisionMapping):
 
         return category_decision, category_probs
 
+
+    def probabilities_to_decision_batch(self, probabilities):
+        """Return one of 16 categories for each row of a batch of probabilities.
+
+        Keyword arguments:
+        probabilities -- a np.ndarray of shape (batch size, 1000)
+                         (softmax output: all values should be
+                         within [0,1])
+
+        Returns the list of category decisions and a (batch size, 16)
+        np.ndarray of probabilities for each of the 16 categories.
+        """
+
+        self.check_input(probabilities)
+        assert probabilities.ndim == 2 and probabilities.shape[1] == 1000
+
+        if self.aggregation_function is np.mean:
+            # Offset each row's bins so that one np.bincount sums the whole batch
+            num_bins = len(self.categories) + 1
+            bins = self.class_to_category + num_bins * np.arange(len(probabilities))[:, None]
+            category_sums = np.bincount(bins.ravel(), weights=probabilities.ravel(),
+                                        minlength=num_bins * len(probabilities))
+            category_probs = category_sums.reshape(-1, num_bins)[:, :len(self.categories)] / self.category_sizes
+        else:
+            category_probs = np.array([self.probabilities_to_decision(p)[1] for p in probabilities])
+
+        category_decisions = [self.categories[i] for i in category_probs.argmax(axis=1)]
+
+        return category_decisions, category_probs
@@ -205,7 +205,7 @@ def run_probe(args, mode, num_epochs=100, num_probe_layers=1, i=1):
             predictions = np.zeros(outputs.shape, dtype=int)
             predictions[np.arange(outputs.shape[0]), outputs.argmax(1)] = 1
 
-            acc = np.sum(np.sum(np.multiply(predictions, labels), axis=1), axis=0) / batch_size
+            acc = np.einsum('ij,ij->', predictions, labels) / batch_size
             epoch_acc.append(acc)
 
         #print('\tLoss: {}'.format(np.sum(epoch_loss) / len(epoch_loss)))
@@ -232,7 +232,7 @@ def run_probe(args, mode, num_epochs=100, num_probe_layers=1, i=1):
                 predictions = np.zeros(outputs.shape, dtype=int)
                 predictions[np.arange(outputs.shape[0]), outputs.argmax(1)] = 1
 
-                acc = np.sum(np.sum(np.multiply(predictions, labels), axis=1), axis=0) / test_size
+                acc = np.einsum('ij,ij->', predictions, labels) / test_size
                 test_acc.append(acc)
 
             #print('\tEval Loss: {}'.format(test_loss[0]))
@@ -26,3 +26,133 @@ def test_initialize_model():
 
         print("Running test for {0}...".format(model_type))
         assert embedding_size == embedding.shape[0]
+
+
+def test_generate_triplets():
+    from data import generate_novel_triplets, generate_geirhos_triplets
+
+    rng = np.random.RandomState(0)
+
+    novel_shape_classes = {}
+    for i in range(40):
+        novel_shape_classes['image{0}.png'.format(i)] = {'shape': 'shape{0}'.format(rng.randint(5)),
+                                                         'texture': 'texture{0}'.format(rng.randint(5))}
+
+    geirhos_shape_classes = {}
+    for i in range(60):
+        shape_spec = 'shape{0}'.format(rng.randint(6))
+        texture_spec = 'texture{0}'.format(rng.randint(6))
+        geirhos_shape_classes['{0}-{1}-{2}.png'.format(shape_spec, texture_spec, i)] = {
+            'shape_spec': shape_spec, 'texture_spec': texture_spec}
+
+    # Original pairwise generation
+    def pairwise_triplets(shape_classes, shape_key, texture_key, check_texture):
+        triplets_by_image = {}
+        all_triplets = []
+
+        for image in shape_classes.keys():
+            shape = shape_classes[image][shape_key]
+            texture = shape_classes[image][texture_key]
+            triplets_by_image[image] = {'shape matches': [], 'texture matches': [], 'triplets': []}
+
+            for potential_match in shape_classes.keys():
+                if potential_match == image:
+                    continue
+                elif shape_classes[potential_match][shape_key] == shape:
+                    if not check_texture or shape_classes[potential_match][texture_key] != texture:
+                        triplets_by_image[image]['shape matches'].append(potential_match)
+                elif shape_classes[potential_match][texture_key] == texture:
+                    triplets_by_image[image]['texture matches'].append(potential_match)
+
+            for shape_match in triplets_by_image[image]['shape matches']:
+                for texture_match in triplets_by_image[image]['texture matches']:
+                    triplet = [image, shape_match, texture_match]
+                    triplets_by_image[image]['triplets'].append(triplet)
+                    all_triplets.append(triplet)
+
+        return triplets_by_image, all_triplets
+
+    assert generate_novel_triplets(novel_shape_classes) == \
+           pairwise_triplets(novel_shape_classes, 'shape', 'texture', False)
+    assert generate_geirhos_triplets(geirhos_shape_classes) == \
+           pairwise_triplets(geirhos_shape_classes, 'shape_spec', 'texture_spec', True)
+
+
+def test_probabilities_to_decision():
+    from probabilities_to_decision import ImageNetProbabilitiesTo16ClassesMapping
+
+    rng = np.random.RandomState(0)
+    probabilities = rng.dirichlet(np.ones(1000), size=50)
+
+    mapping = ImageNetProbabilitiesTo16ClassesMapping()  # np.mean: bincount and matmul paths
+    loop_mapping = ImageNetProbabilitiesTo16ClassesMapping(
+        aggregation_function=lambda values: np.mean(values))  # forces the per-category loop
+
+    batch_decisions, batch_probs = mapping.probabilities_to_decision_batch(probabilities)
+    loop_batch_decisions, loop_batch_probs = loop_mapping.probabilities_to_decision_batch(probabilities)
+
+    assert batch_decisions == loop_batch_decisions
+    assert np.allclose(batch_probs, loop_batch_probs)
+
+    for i in range(len(probabilities)):
+        decision, category_probs = mapping.probabilities_to_decision(probabilities[i])
+        loop_decision, loop_category_probs = loop_mapping.probabilities_to_decision(probabilities[i])
+
+        assert decision == loop_decision == batch_decisions[i]
+        assert np.allclose(category_probs, loop_category_probs)
+        assert np.allclose(category_probs, batch_probs[i])
+
+
+def test_calculate_totals(tmp_path):
+    import pandas as pd
+    from evaluate import csv_class_values, calculate_totals
+    from probabilities_to_decision import get_human_object_recognition_categories
+
+    shape_categories = get_human_object_recognition_categories()
+    rng = np.random.RandomState(0)
+
+    shape_dict = {}
+    shape_spec_dict = {}
+    expected = {shape: [0, 0, 0, 0, 0] for shape in shape_categories}
+
+    for shape in shape_categories:
+        shape_dict[shape] = {}
+        shape_spec_dict[shape] = []
+
+        for texture_root in shape_categories:
+            if texture_root == shape:
+                continue
+
+            texture = texture_root + str(rng.randint(1, 4))
+            class_values = rng.dirichlet(np.ones(16))
+            decision = shape_categories[rng.randint(16)]
+            decision_restricted = [shape, texture_root, decision][rng.randint(3)]
+            shape_dict[shape][texture + '0'] = [decision, class_values, decision_restricted, rng.rand(2)]
+            shape_spec_dict[shape].append(texture)
+
+            # Original row-wise totals
+            if int(shape == decision_restricted) != int(texture_root == decision_restricted):
+                expected[shape][0] += int(decision == shape)
+                expected[shape][1] += int(decision == texture_root)
+                expected[shape][2] += int(decision != shape and decision != texture_root)
+                expected[shape][3] += int(shape == decision_restricted)
+                expected[shape][4] += int(texture_root == decision_restricted)
+
+    csv_class_values(shape_dict, shape_categories, shape_spec_dict, str(tmp_path))
+    calculate_totals(shape_categories, str(tmp_path))
+    totals = pd.read_csv(tmp_path / 'totals.csv')
+
+    for shape_idx, shape in enumerate(shape_categories + ['total']):
+        if shape == 'total':
+            counts = [sum(values[i] for values in expected.values()) for i in range(5)]
+        else:
+            counts = expected[shape]
+
+        row = totals.iloc[shape_idx]
+        assert row['Shape Category'] == shape
+        assert row['Number Shape Decisions'] == counts[0]
+        assert row['Number Texture Decisions'] == counts[1]
+        assert row['Number Neither'] == counts[2]
+        assert row['Number Restricted Shape Decisions'] == counts[3]
+        assert row['Number Restricted Texture Decisions'] == counts[4]
+        assert row['Total Number Stimuli'] == counts[0] + counts[1] + counts[2]